@@ -4,7 +4,8 @@ This script defines a Flask-based web application for managing books.
 Key Features:
 1. View Details: Retrieve details of a specific book and its associated
    author.
-2. Search: Search books by title.
+2. Search: Search books by title; when no title contains the query, a
+   typo-tolerant trigram search over titles and author names is used.
 3. Home Page: View and sort the list of books by title or author,
    in ascending or descending order.
 4. Add Author: Add new authors with name, birthdate, and (optional) date
@@ -13,28 +14,113 @@ Key Features:
 6. Delete Book: Remove a book from the database using its ID.
 7. Delete Author: Remove an author and their books from the database
    using their ID.
+8. Change Feed: Read the log of catalog mutations from a cursor, either
+   as JSON (with optional long-polling) or as a Server-Sent Events
+   stream.
+9. Dedupe: 'flask --app app dedupe' reports duplicate and near-duplicate
+   books and authors, and optionally merges duplicate authors.
 
 """
 
+import json
+import os
+import threading
+import time
 from pathlib import Path
 
+import click
 from marshmallow import Schema, fields
-from flask import Flask, request, render_template
+from flask import Flask, request, render_template, jsonify, Response, \
+    stream_with_context
 
 from data_models import db, Author
+from changelog_util import fetch_changes, change_to_dict, seed_change_log, \
+    DEFAULT_CHANGE_LIMIT
 from crud_util import author_add, book_add, book_delete, get_book, get_author, \
     author_delete
 from query_util import search_book, sort_author_asc, sort_author_desc, \
-    sort_title_asc, sort_title_desc, fetch_without_order
+    sort_title_asc, sort_title_desc, fetch_without_order, fetch_books_by_ids
+from trigram_util import TrigramIndex
+from dedupe_util import dedupe_report, merge_duplicate_authors
 
 app = Flask(__name__)
 
-app.config[
-    "SQLALCHEMY_DATABASE_URI"] = (f"sqlite:///{Path(__file__).parent}/"
-                                  f"data/library.sqlite3")
+# LIBRARY_DATABASE_URI selects another database, e.g. for tests
+app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get(
+    "LIBRARY_DATABASE_URI",
+    f"sqlite:///{Path(__file__).parent}/data/library.sqlite3")
 
 db.init_app(app)
 
+# Creates any missing table (e.g. the change log) in an existing database;
+# tables that are already present are left untouched. A new change log
+# starts with an insert for every author and book already stored.
+with app.app_context():
+    db.create_all()
+    seed_change_log(db)
+
+# Optional file used to persist the fuzzy search index between restarts
+app.config["SEARCH_INDEX_PATH"] = os.environ.get("SEARCH_INDEX_PATH")
+
+
+# Loaded or built in a background thread when the server starts (never at
+# import, so CLI commands such as 'dedupe' do not pay for it, and never
+# within a request); fuzzy results are skipped until it is ready
+search_index = None
+search_index_thread = None
+search_index_lock = threading.Lock()
+
+
+def warm_up_search_index() -> threading.Thread:
+    """
+    Start loading the fuzzy search index in a background thread, unless
+    that has already been started.
+
+    The index is read from SEARCH_INDEX_PATH when that file exists, or
+    built from the database otherwise. If a path is configured, the index
+    is saved so the next start only replays newer changes.
+
+    Returns:
+        threading.Thread: The thread loading the index.
+    """
+
+    global search_index_thread
+
+    with search_index_lock:
+        if search_index_thread is None:
+            search_index_thread = threading.Thread(
+                target=load_search_index, name="search-index", daemon=True)
+            search_index_thread.start()
+
+    return search_index_thread
+
+
+def load_search_index():
+    """
+    Load or build the fuzzy search index and publish it to requests.
+
+    Returns:
+        None
+    """
+
+    global search_index
+
+    path = app.config["SEARCH_INDEX_PATH"]
+
+    with app.app_context():
+        index = TrigramIndex.load(path) if path else None
+        if index is None:
+            index = TrigramIndex.build(db)
+        index.sync(db)
+
+    if path:
+        try:
+            index.save(path)
+        except OSError as e:
+            print(e)
+
+    search_index = index
+
 
 class ItemSchema(Schema):
     title = fields.Str(required=True)
@@ -50,6 +136,11 @@ DIRECTION_DESC = "desc"
 TITLE = "title"
 AUTHOR = "author"
 
+# Change feed long-polling and streaming, in seconds
+CHANGES_MAX_WAIT = 30
+CHANGES_POLL_INTERVAL = 1
+CHANGES_HEARTBEAT_INTERVAL = 15
+
 
 @app.route('/book/<int:book_id>/details', methods=['GET'])
 def get_details(book_id: int):
@@ -78,7 +169,10 @@ def search():
     Search for books by title and display the results.
 
     Retrieves books with titles matching the search query (case-insensitive)
-    and displays them on the home page.
+    and displays them on the home page. If no title contains the query,
+    books whose title or author name is similar to it (e.g. misspelled)
+    are shown instead, most similar first, once the search index has
+    been loaded.
 
     Parameter:
         title (str): The search query for the book title, retrieved from the
@@ -91,13 +185,25 @@ def search():
                                 results.
     """
 
-    title = request.form.get("title")
+    query = request.form.get("title")
 
-    title = f"%{str(title).lower()}%"  # Used for SQL LIKE statement where
+    title = f"%{str(query).lower()}%"  # Used for SQL LIKE statement where
     # % is used as wildcards
 
     authors_of_books = search_book(db, title)
 
+    if not authors_of_books and query:
+        index = search_index
+        if index is None:
+            # Not ready yet; also starts it under servers other than
+            # 'python app.py'
+            warm_up_search_index()
+        else:
+            index.sync(db)  # Applies writes made since the last search
+            ranked = index.search(query)
+            authors_of_books = fetch_books_by_ids(
+                db, [book_id for book_id, _ in ranked])
+
     if not authors_of_books:
         return render_template('home.html',
                                authors_of_books=authors_of_books,
@@ -313,9 +419,203 @@ def delete_author(author_id):
                                success_author=False)
 
 
+def parse_non_negative_int(value, default: int):
+    """
+    Parse a query parameter or header holding a non-negative integer.
+
+    Parameters:
+        value (str): The raw value, or None if it was not sent.
+        default (int): The value used when the parameter was not sent.
+
+    Returns:
+        int: The parsed value or the default, or None if the value is not
+             a non-negative integer written with ASCII digits.
+    """
+
+    if value is None:
+        return default
+
+    if not (value.isascii() and value.isdecimal()):
+        return None
+
+    return int(value)
+
+
+@app.route('/changes', methods=['GET'])
+def get_changes():
+    """
+    Return the catalog changes recorded after a cursor as JSON.
+
+    When 'wait' is given and no change is available yet, the request is
+    held open (long-poll) until a change is recorded or the wait expires.
+
+    Parameters:
+        cursor (int): The ID of the last change already seen; defaults
+                      to 0 to read the log from the beginning.
+        limit (int): The maximum number of changes to return (at least 1,
+                     capped at MAX_CHANGE_LIMIT).
+        wait (int): The number of seconds to wait for new changes, capped
+                    at CHANGES_MAX_WAIT; defaults to 0 (no waiting).
+
+    Returns:
+        Response: A JSON object with:
+            - changes: The list of changes, oldest first.
+            - cursor: The cursor to send with the next request.
+        or a 400 error if a parameter is not a non-negative integer or
+        limit is 0.
+    """
+
+    cursor = parse_non_negative_int(request.args.get('cursor'), 0)
+    limit = parse_non_negative_int(request.args.get('limit'),
+                                   DEFAULT_CHANGE_LIMIT)
+    wait = parse_non_negative_int(request.args.get('wait'), 0)
+
+    if cursor is None or wait is None or not limit:
+        return ("cursor and wait must be non-negative integers and limit "
+                "a positive integer"), 400
+
+    deadline = time.monotonic() + max(0, min(wait, CHANGES_MAX_WAIT))
+
+    changes = fetch_changes(db, cursor, limit)
+    while not changes and time.monotonic() < deadline:
+        time.sleep(CHANGES_POLL_INTERVAL)
+        db.session.rollback()  # Ends the read so the next poll sees commits
+        changes = fetch_changes(db, cursor, limit)
+
+    if changes:
+        cursor = changes[-1].id
+
+    return jsonify(changes=[change_to_dict(change) for change in changes],
+                   cursor=cursor)
+
+
+@app.route('/changes/stream', methods=['GET'])
+def stream_changes():
+    """
+    Stream the catalog changes recorded after a cursor as Server-Sent
+    Events.
+
+    Each change is sent as a 'change' event whose id is the change ID, so
+    a reconnecting client resumes from the 'Last-Event-ID' header.
+
+    Parameters:
+        cursor (int): The ID of the last change already seen; used when no
+                      'Last-Event-ID' header is sent, defaults to 0.
+
+    Returns:
+        Response: A 'text/event-stream' response, or a 400 error if the
+                  cursor is not a non-negative integer.
+    """
+
+    cursor = parse_non_negative_int(
+        request.headers.get('Last-Event-ID', request.args.get('cursor')), 0)
+
+    if cursor is None:
+        return "cursor must be a non-negative integer", 400
+
+    @stream_with_context
+    def generate(cursor: int):
+        last_sent = time.monotonic()
+        while True:
+            changes = [change_to_dict(change)
+                       for change in fetch_changes(db, cursor)]
+            db.session.rollback()  # Ends the read so the next poll sees commits
+
+            for change in changes:
+                cursor = change["id"]
+                yield (f"id: {change['id']}\n"
+                       f"event: change\n"
+                       f"data: {json.dumps(change)}\n\n")
+
+            if changes:
+                last_sent = time.monotonic()
+                continue
+
+            if time.monotonic() - last_sent >= CHANGES_HEARTBEAT_INTERVAL:
+                last_sent = time.monotonic()
+                yield ": heartbeat\n\n"  # Keeps idle connections open
+
+            time.sleep(CHANGES_POLL_INTERVAL)
+
+    return Response(generate(cursor), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache'})
+
+
+@app.cli.command('dedupe')
+@click.option('--output', type=click.Path(dir_okay=False),
+              help='Write the merge report to this JSON file.')
+@click.option('--merge', is_flag=True,
+              help='Merge the author groups whose names are equal once '
+                   'normalized: move their books to the surviving author '
+                   'and delete the duplicates.')
+@click.option('--merge-from', type=click.File('r'),
+              help='Merge every author group of a reviewed (edited) '
+                   'report instead of detecting duplicates.')
+@click.option('--workers', type=int, default=None,
+              help='Number of worker processes (default: CPU count).')
+def dedupe(output, merge, merge_from, workers):
+    """
+    Report duplicate and near-duplicate books and authors.
+
+    Near-duplicate author groups (e.g. 'Henry James' and 'Henry Jameson')
+    are only reported; to merge them, edit the report down to the groups
+    that really are duplicates and pass it to --merge-from.
+
+    Parameters:
+        output (str): The file the JSON merge report is written to;
+                      printed to stdout if not given.
+        merge (bool): Whether to merge the author groups flagged
+                      'auto_merge' into their survivor after reporting.
+        merge_from (file): A reviewed report whose author groups are all
+                           merged; no detection is run. Every group is
+                           checked before the first is merged.
+        workers (int): The number of worker processes.
+
+    Returns:
+        None
+    """
+
+    if merge and merge_from:
+        raise click.UsageError("--merge cannot be combined with "
+                               "--merge-from")
+
+    if merge_from:
+        try:
+            merged, moved = merge_duplicate_authors(
+                db, json.load(merge_from), reviewed=True)
+        except ValueError as e:  # Includes invalid JSON
+            raise click.ClickException(
+                f"Nothing merged from {merge_from.name}: {e}")
+        click.echo(f"Merged {merged} author group(s), moved {moved} "
+                   f"book(s)", err=True)
+        return
+
+    report = dedupe_report(db, workers)
+    report_json = json.dumps(report, indent=2)
+
+    if output:
+        Path(output).write_text(report_json)
+    else:
+        click.echo(report_json)
+
+    click.echo(f"{len(report['authors'])} duplicate author group(s), "
+               f"{len(report['books'])} duplicate book group(s)", err=True)
+
+    if merge:
+        merged, moved = merge_duplicate_authors(db, report)
+        click.echo(f"Merged {merged} author group(s), moved {moved} "
+                   f"book(s); {len(report['authors']) - merged} group(s) "
+                   f"left for review", err=True)
+
+
 if __name__ == '__main__':
     """
     with app.app_context():
     db.create_all()
     """
+    # With debug=True the reloader also runs this block in its watching
+    # parent process; only the serving child needs the index.
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        warm_up_search_index()
+
     app.run(host="0.0.0.0", port=5002, debug=True)
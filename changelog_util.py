@@ -0,0 +1,190 @@
+import json
+
+from sqlalchemy import select
+
+from data_models import Author, Book, CatalogChange
+
+"""
+Names used in the change log for the kind of record and mutation.
+"""
+ENTITY_AUTHOR = "author"
+ENTITY_BOOK = "book"
+
+OPERATION_INSERT = "insert"
+OPERATION_UPDATE = "update"
+OPERATION_DELETE = "delete"
+
+"""
+Default and maximum number of changes returned by a single fetch.
+"""
+DEFAULT_CHANGE_LIMIT = 100
+MAX_CHANGE_LIMIT = 1000
+
+
+def author_payload(author: Author) -> dict:
+    """
+    Builds the JSON-serializable snapshot of an author for the change log.
+
+    Parameter:
+        author (Author): The author to be serialized.
+
+    Returns:
+        dict: The author's ID, name, birthdate and date of death.
+    """
+
+    return {
+        "id": author.id,
+        "name": author.name,
+        "birth_date": _iso_or_none(author.birth_date),
+        "date_of_death": _iso_or_none(author.date_of_death),
+    }
+
+
+def book_payload(book: Book) -> dict:
+    """
+    Builds the JSON-serializable snapshot of a book for the change log.
+
+    Parameter:
+        book (Book): The book to be serialized.
+
+    Returns:
+        dict: The book's ID, author ID, ISBN, title, cover and publication
+              year.
+    """
+
+    return {
+        "id": book.id,
+        "author_id": book.author_id,
+        "isbn": book.isbn,
+        "title": book.title,
+        "cover": book.cover,
+        "publication_year": _iso_or_none(book.publication_year),
+    }
+
+
+def record_change(db, entity: str, entity_id: int, operation: str,
+                  payload: dict):
+    """
+    Adds a change log entry to the current session.
+
+    The entry is not committed here; it is written by the caller's commit
+    so that the change and the mutation it describes are stored in the
+    same transaction.
+
+    Parameters:
+        db: The database session object to interact with the database.
+        entity (str): The kind of record that changed, 'author' or 'book'.
+        entity_id (int): The ID of the record that changed.
+        operation (str): The kind of mutation, 'insert', 'update' or
+                         'delete'.
+        payload (dict): The JSON-serializable snapshot of the record; for
+                        updates, a dict with the 'before' and 'after'
+                        snapshots.
+
+    Returns:
+        None
+    """
+
+    change = CatalogChange()
+    change.entity = entity
+    change.entity_id = entity_id
+    change.operation = operation
+    change.payload = json.dumps(payload)
+    db.session.add(change)
+
+
+def seed_change_log(db) -> int:
+    """
+    Records an insert for every existing author and book when the change
+    log is still empty.
+
+    Rows stored before the change log existed would otherwise never reach
+    the feed, and consumers would have to read the whole catalog once to
+    get started. All entries are written in a single transaction, authors
+    before their books.
+
+    Parameter:
+        db: The database session object to interact with the database.
+
+    Returns:
+        int: The number of change log entries written; 0 if the log
+             already had entries.
+    """
+
+    if db.session.execute(select(CatalogChange.id).limit(1)).first():
+        return 0
+
+    count = 0
+    for author in db.session.execute(
+            select(Author).order_by(Author.id)).scalars():
+        record_change(db, ENTITY_AUTHOR, author.id, OPERATION_INSERT,
+                      author_payload(author))
+        count += 1
+
+    for book in db.session.execute(
+            select(Book).order_by(Book.id)).scalars():
+        record_change(db, ENTITY_BOOK, book.id, OPERATION_INSERT,
+                      book_payload(book))
+        count += 1
+
+    db.session.commit()
+    return count
+
+
+def fetch_changes(db, cursor: int, limit: int = DEFAULT_CHANGE_LIMIT):
+    """
+    Retrieves the changes recorded after the given cursor, oldest first.
+
+    Parameters:
+        db: The database session object to interact with the database.
+        cursor (int): The ID of the last change already seen by the
+                      consumer; 0 to read the log from the beginning.
+        limit (int): The maximum number of changes to return, capped at
+                     MAX_CHANGE_LIMIT.
+
+    Returns:
+        list: A list of CatalogChange objects with an ID greater than the
+              cursor, ordered by ID.
+    """
+
+    limit = max(1, min(limit, MAX_CHANGE_LIMIT))
+
+    return db.session.execute(
+        select(CatalogChange).where(CatalogChange.id > cursor).order_by(
+            CatalogChange.id).limit(limit)).scalars().all()
+
+
+def change_to_dict(change: CatalogChange) -> dict:
+    """
+    Converts a change log entry into a JSON-serializable dictionary.
+
+    Parameter:
+        change (CatalogChange): The change log entry to be converted.
+
+    Returns:
+        dict: The change's ID, entity, entity ID, operation, creation time
+              and decoded payload.
+    """
+
+    return {
+        "id": change.id,
+        "entity": change.entity,
+        "entity_id": change.entity_id,
+        "operation": change.operation,
+        "created_at": _iso_or_none(change.created_at),
+        "payload": json.loads(change.payload),
+    }
+
+
+def _iso_or_none(value):
+    """
+    Formats a date or datetime as an ISO 8601 string.
+
+    Parameter:
+        value (date | datetime | None): The value to be formatted.
+
+    Returns:
+        str | None: The ISO 8601 representation, or None if value is None.
+    """
+
+    return value.isoformat() if value is not None else None
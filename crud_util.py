@@ -1,12 +1,16 @@
 from datetime import datetime
 
 from api_util import get_book_cover_from_api
+from changelog_util import record_change, author_payload, book_payload, \
+    ENTITY_AUTHOR, ENTITY_BOOK, OPERATION_INSERT, OPERATION_UPDATE, \
+    OPERATION_DELETE
 from data_models import Author, Book
 
 
 def author_add(db, birthdate: str, date_of_death: str, name: str):
     """
-    Adds a new author to the database.
+    Adds a new author to the database and records the insert in the
+    change log.
 
     Parameters:
         db: The database session object to interact with the database.
@@ -29,13 +33,18 @@ def author_add(db, birthdate: str, date_of_death: str, name: str):
         author.date_of_death = datetime.strptime(date_of_death,
                                                  format).date()
     db.session.add(author)
+    db.session.flush()  # Assigns author.id for the change log entry
+
+    record_change(db, ENTITY_AUTHOR, author.id, OPERATION_INSERT,
+                  author_payload(author))
     db.session.commit()
 
 
 def book_add(db, author_id: int, isbn: str, publication_year: str,
              title: str):
     """
-    Adds a new book to the database.
+    Adds a new book to the database and records the insert in the
+    change log.
 
     Parameter:
         db: The database session object to interact with the database.
@@ -50,19 +59,24 @@ def book_add(db, author_id: int, isbn: str, publication_year: str,
 
     format = '%Y-%m-%d'
     book = Book()
-    book.author_id = author_id
+    book.author_id = int(author_id)  # Form values arrive as strings
     book.isbn = isbn
     book.title = title
     book.cover = get_book_cover_from_api(isbn)
     book.birth_date = datetime.strptime(publication_year,
                                         format).date()
     db.session.add(book)
+    db.session.flush()  # Assigns book.id for the change log entry
+
+    record_change(db, ENTITY_BOOK, book.id, OPERATION_INSERT,
+                  book_payload(book))
     db.session.commit()
 
 
 def book_delete(db, book_id: int):
     """
-    Deletes a book from the database based on its ID.
+    Deletes a book from the database based on its ID and records the
+    delete in the change log.
 
     Parameters:
         db: The database session object to interact with the database.
@@ -72,13 +86,16 @@ def book_delete(db, book_id: int):
         None
     """
     book = db.session.get(Book, book_id)
+    record_change(db, ENTITY_BOOK, book.id, OPERATION_DELETE,
+                  book_payload(book))
     db.session.delete(book)
     db.session.commit()
 
 
 def author_delete(db, author_id: int):
     """
-    Deletes an author from the database based on their ID.
+    Deletes an author and their books from the database based on the
+    author's ID and records each delete in the change log.
 
     Parameters:
         db: The database session object to interact with the database.
@@ -88,10 +105,69 @@ def author_delete(db, author_id: int):
         None
     """
     author = db.session.get(Author, author_id)
+
+    # The cascade removes the author's books as well, so each of them is
+    # logged before the author itself.
+    for book in author.books:
+        record_change(db, ENTITY_BOOK, book.id, OPERATION_DELETE,
+                      book_payload(book))
+    record_change(db, ENTITY_AUTHOR, author.id, OPERATION_DELETE,
+                  author_payload(author))
     db.session.delete(author)
     db.session.commit()
 
 
+def author_merge(db, survivor_id: int, duplicate_ids: list):
+    """
+    Merges duplicate authors into a surviving author.
+
+    The books of every duplicate author are moved to the survivor and the
+    duplicates are then deleted. Every moved book and deleted author is
+    recorded in the change log, all in a single transaction.
+
+    Parameters:
+        db: The database session object to interact with the database.
+        survivor_id (int): The ID of the author who keeps the books.
+        duplicate_ids (list): The IDs of the authors to be merged into the
+                              survivor.
+
+    Returns:
+        int: The number of books moved to the survivor.
+    """
+
+    survivor = db.session.get(Author, survivor_id)
+    if survivor is None:
+        raise ValueError(f"Author {survivor_id} not found")
+
+    moved = 0
+    for duplicate_id in duplicate_ids:
+        if duplicate_id == survivor_id:
+            continue
+
+        duplicate = db.session.get(Author, duplicate_id)
+        if duplicate is None:
+            raise ValueError(f"Author {duplicate_id} not found")
+
+        for book in list(duplicate.books):
+            before = book_payload(book)
+            book.author_id = survivor.id
+            record_change(db, ENTITY_BOOK, book.id, OPERATION_UPDATE,
+                          {"before": before, "after": book_payload(book)})
+            moved += 1
+
+        # Reloads the (now empty) books collection so the delete cascade
+        # does not remove the books that were just moved.
+        db.session.flush()
+        db.session.expire(duplicate, ["books"])
+
+        record_change(db, ENTITY_AUTHOR, duplicate.id, OPERATION_DELETE,
+                      author_payload(duplicate))
+        db.session.delete(duplicate)
+
+    db.session.commit()
+    return moved
+
+
 def get_book(db, book_id: int):
     """
     Retrieves a book from the database based on its ID.
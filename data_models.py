@@ -1,7 +1,7 @@
-from datetime import date
+from datetime import date, datetime
 
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import ForeignKey
+from sqlalchemy import ForeignKey, func
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, \
     relationship
 
@@ -95,3 +95,51 @@ class Book(db.Model):
                 f"title = {self.title}, "
                 f"publication_year = {self.publication_year})"
                 )
+
+
+class CatalogChange(db.Model):
+    """
+    Represents one entry of the append-only catalog change log.
+
+    A row is written in the same transaction as every author/book insert,
+    update and delete, so consumers can mirror the catalog incrementally by
+    reading the log from the last id they have seen.
+
+    Attributes:
+        id (int): The unique, monotonically increasing identifier of the
+                  change (primary key), used as the resume cursor.
+        entity (str): The kind of record that changed, 'author' or 'book'.
+        entity_id (int): The ID of the author or book that changed.
+        operation (str): The kind of mutation, 'insert', 'update' or
+                         'delete'.
+        payload (str): A JSON snapshot of the record at the time of the
+                       change; for updates, an object with the 'before'
+                       and 'after' snapshots.
+        created_at (datetime): The time the change was recorded.
+    """
+
+    __tablename__ = "catalog_change"
+
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    entity: Mapped[str]
+    entity_id: Mapped[int]
+    operation: Mapped[str]
+    payload: Mapped[str]
+    created_at: Mapped[datetime] = mapped_column(
+        server_default=func.now())
+
+    def __repr__(self):
+        return (f"CatalogChange(id = {self.id}, "
+                f"entity = {self.entity}, "
+                f"entity_id = {self.entity_id}, "
+                f"operation = {self.operation}, "
+                f"created_at = {self.created_at})"
+                )
+
+    def __str__(self):
+        return (f"CatalogChange(id = {self.id}, "
+                f"entity = {self.entity}, "
+                f"entity_id = {self.entity_id}, "
+                f"operation = {self.operation}, "
+                f"created_at = {self.created_at})"
+                )
@@ -0,0 +1,558 @@
+import hashlib
+import os
+import random
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from itertools import combinations
+
+from sqlalchemy import select, func
+
+from crud_util import author_merge
+from data_models import Author, Book
+from trigram_util import normalize, trigrams
+
+"""
+MinHash signature length and its split into LSH bands. With 16 bands of 4
+rows, pairs with a Jaccard similarity of about 0.5 or more are likely to
+share a bucket, while dissimilar pairs rarely do.
+"""
+NUM_PERMUTATIONS = 64
+LSH_BANDS = 16
+LSH_ROWS = NUM_PERMUTATIONS // LSH_BANDS
+
+"""
+Minimum Jaccard similarity of the shingle sets for two candidates to be
+reported as near-duplicates.
+"""
+DEFAULT_AUTHOR_THRESHOLD = 0.6
+DEFAULT_BOOK_THRESHOLD = 0.7
+
+"""
+Below this number of records the signatures are computed in-process, as
+starting worker processes would take longer than the work itself.
+"""
+PARALLEL_MIN_RECORDS = 20000
+PARALLEL_CHUNK_SIZE = 5000
+
+"""
+LSH buckets up to this size are expanded into all pairs of their members;
+larger buckets (e.g. many records with identical shingles) only pair
+neighbouring members to keep the number of candidates linear.
+"""
+LSH_MAX_BUCKET_PAIRS_SIZE = 50
+
+MAX_HASH = (1 << 64) - 1
+
+# Each MinHash function XORs the 64-bit shingle hash with a random mask,
+# which lets min() run over map() in C. The seed is fixed so signatures
+# are comparable between runs and worker processes.
+_rng = random.Random(1)
+HASH_MASKS = [_rng.getrandbits(64) for _ in range(NUM_PERMUTATIONS)]
+
+
+def normalize_isbn(isbn: str):
+    """
+    Converts an ISBN-10 or ISBN-13 into its canonical ISBN-13 form.
+
+    Hyphens, spaces and other separators are ignored and the check digit
+    is validated, so '0-06-112008-1' and '9780061120084' normalize to the
+    same value.
+
+    Parameter:
+        isbn (str): The ISBN as stored in the catalog.
+
+    Returns:
+        str | None: The 13-digit ISBN, or None if isbn is not a valid
+                    ISBN-10 or ISBN-13.
+    """
+
+    digits = "".join(char for char in str(isbn or "").upper()
+                     if char.isdigit() or char == "X")
+
+    if len(digits) == 10:
+        if not digits[:9].isdigit():
+            return None
+        total = sum((10 - i) * (10 if char == "X" else int(char))
+                    for i, char in enumerate(digits))
+        if total % 11 != 0:
+            return None
+        digits = "978" + digits[:9]
+        return digits + _isbn13_check_digit(digits)
+
+    if len(digits) == 13 and digits.isdigit():
+        if _isbn13_check_digit(digits[:12]) != digits[12]:
+            return None
+        return digits
+
+    return None
+
+
+def _isbn13_check_digit(first_twelve: str) -> str:
+    """
+    Computes the check digit of an ISBN-13 from its first twelve digits.
+    """
+
+    total = sum(int(char) * (3 if i % 2 else 1)
+                for i, char in enumerate(first_twelve))
+    return str((10 - total % 10) % 10)
+
+
+def minhash(shingles: set) -> tuple:
+    """
+    Computes the MinHash signature of a set of shingles.
+
+    Parameter:
+        shingles (set): The shingles (e.g. trigrams) of a record.
+
+    Returns:
+        tuple: NUM_PERMUTATIONS integers; the share of positions in
+               which two signatures agree estimates the Jaccard similarity
+               of their shingle sets.
+    """
+
+    if not shingles:
+        return (MAX_HASH,) * NUM_PERMUTATIONS
+
+    hashes = [int.from_bytes(
+        hashlib.blake2b(shingle.encode(), digest_size=8).digest(), "big")
+        for shingle in shingles]
+
+    return tuple(min(map(mask.__xor__, hashes)) for mask in HASH_MASKS)
+
+
+def _signature_chunk(records: list) -> list:
+    """
+    Computes the MinHash signatures of a chunk of (ID, shingles) records;
+    runs in a worker process.
+    """
+
+    return [(record_id, minhash(shingles)) for record_id, shingles in records]
+
+
+def compute_signatures(records: list, workers=None) -> dict:
+    """
+    Computes the MinHash signatures of many records, in parallel across
+    CPU cores for large inputs.
+
+    Parameters:
+        records (list): A list of (ID, shingles) tuples.
+        workers (int, optional): The number of worker processes; defaults
+                                 to the number of CPU cores.
+
+    Returns:
+        dict: Record ID -> MinHash signature.
+    """
+
+    workers = workers or os.cpu_count() or 1
+
+    if workers == 1 or len(records) < PARALLEL_MIN_RECORDS:
+        return dict(_signature_chunk(records))
+
+    chunks = [records[i:i + PARALLEL_CHUNK_SIZE]
+              for i in range(0, len(records), PARALLEL_CHUNK_SIZE)]
+
+    signatures = {}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for chunk in executor.map(_signature_chunk, chunks):
+            signatures.update(chunk)
+    return signatures
+
+
+def lsh_candidates(signatures: dict) -> set:
+    """
+    Finds candidate duplicate pairs with locality-sensitive hashing.
+
+    Each signature is split into LSH_BANDS bands; records sharing an
+    identical band land in the same bucket. Every two members of a bucket
+    form a candidate pair, except in buckets larger than
+    LSH_MAX_BUCKET_PAIRS_SIZE, where each member is only paired with the
+    next one so that oversized buckets stay linear.
+
+    Parameter:
+        signatures (dict): Record ID -> MinHash signature.
+
+    Returns:
+        set: Candidate (ID, ID) pairs, smaller ID first.
+    """
+
+    pairs = set()
+    for band in range(LSH_BANDS):
+        start = band * LSH_ROWS
+        buckets = defaultdict(list)
+        for record_id, signature in signatures.items():
+            buckets[signature[start:start + LSH_ROWS]].append(record_id)
+
+        for members in buckets.values():
+            if len(members) <= LSH_MAX_BUCKET_PAIRS_SIZE:
+                bucket_pairs = combinations(members, 2)
+            else:
+                bucket_pairs = zip(members, members[1:])
+
+            for first, second in bucket_pairs:
+                pairs.add((min(first, second), max(first, second)))
+    return pairs
+
+
+def jaccard(first: set, second: set) -> float:
+    """
+    Computes the Jaccard similarity of two sets.
+
+    Parameters:
+        first (set): The first set.
+        second (set): The second set.
+
+    Returns:
+        float: |first & second| / |first | second|, or 0 for empty sets.
+    """
+
+    union = len(first | second)
+    return len(first & second) / union if union else 0.0
+
+
+def cluster(ids, edges: dict) -> list:
+    """
+    Groups records connected by duplicate edges (union-find).
+
+    Parameters:
+        ids (iterable): The IDs of all records.
+        edges (dict): (ID, ID) -> similarity of verified duplicate pairs.
+
+    Returns:
+        list: A list of (sorted list of IDs, minimum edge similarity)
+              tuples, one per group of two or more records.
+    """
+
+    parent = {record_id: record_id for record_id in ids}
+
+    def find(record_id):
+        while parent[record_id] != record_id:
+            parent[record_id] = parent[parent[record_id]]
+            record_id = parent[record_id]
+        return record_id
+
+    for first, second in edges:
+        parent[find(first)] = find(second)
+
+    groups = defaultdict(list)
+    for record_id in parent:
+        groups[find(record_id)].append(record_id)
+
+    min_similarity = {}
+    for (first, _), similarity in edges.items():
+        root = find(first)
+        min_similarity[root] = min(similarity,
+                                   min_similarity.get(root, similarity))
+
+    return [(sorted(members), min_similarity[root])
+            for root, members in groups.items() if len(members) > 1]
+
+
+def find_duplicate_groups(records: dict, exact_keys: dict,
+                          threshold: float, workers=None,
+                          distinct_keys_differ: bool = False) -> list:
+    """
+    Finds groups of duplicate records by exact-key blocking and by
+    MinHash/LSH over their shingles, avoiding an all-pairs comparison.
+
+    Parameters:
+        records (dict): Record ID -> set of shingles.
+        exact_keys (dict): Record ID -> normalized key (e.g. ISBN-13 or
+                           normalized name); records with the same key are
+                           duplicates regardless of their shingles.
+        threshold (float): The minimum Jaccard similarity of near-duplicate
+                           pairs.
+        workers (int, optional): The number of worker processes.
+        distinct_keys_differ (bool): Whether two records with different
+                                     keys are never duplicates (e.g. two
+                                     valid ISBNs), whatever their
+                                     shingles.
+
+    Returns:
+        list: A list of (sorted list of IDs, minimum similarity) tuples.
+    """
+
+    edges = {}
+
+    blocks = defaultdict(list)
+    for record_id, key in exact_keys.items():
+        if key:
+            blocks[key].append(record_id)
+    for members in blocks.values():
+        for other in members[1:]:
+            edges[(min(members[0], other), max(members[0], other))] = 1.0
+
+    signatures = compute_signatures(list(records.items()), workers)
+    for first, second in lsh_candidates(signatures):
+        if (first, second) in edges:
+            continue
+        if (distinct_keys_differ and exact_keys.get(first)
+                and exact_keys.get(second)
+                and exact_keys[first] != exact_keys[second]):
+            continue
+        similarity = jaccard(records[first], records[second])
+        if similarity >= threshold:
+            edges[(first, second)] = similarity
+
+    return cluster(records, edges)
+
+
+def find_duplicate_authors(db, threshold: float = DEFAULT_AUTHOR_THRESHOLD,
+                           workers=None) -> list:
+    """
+    Finds authors stored more than once, e.g. with different spelling,
+    accents or casing.
+
+    Parameters:
+        db: The database session object to interact with the database.
+        threshold (float): The minimum trigram similarity of the names.
+        workers (int, optional): The number of worker processes.
+
+    Returns:
+        list: A list of dicts, one per group, with:
+            - survivor: The author who would keep the books.
+            - duplicates: The other authors of the group.
+            - similarity: The lowest name similarity within the group.
+            - auto_merge: Whether all names of the group are equal once
+                          normalized (accents, casing, punctuation).
+
+        Each cluster of similar names is split by normalized name: every
+        set of two or more equal names becomes an 'auto_merge' group
+        (survivor: the author with the most books, then the lowest ID).
+        If the cluster holds different names, such as 'Henry James' and
+        'Henry Jameson', one more group links the survivors of each name
+        for review (survivor: the name with the most books in total).
+        Review groups follow all 'auto_merge' groups, so merging a report
+        in order merges equal names before their near-matches.
+    """
+
+    rows = db.session.execute(
+        select(Author.id, Author.name, func.count(Book.id)).outerjoin(
+            Book, Book.author_id == Author.id).group_by(Author.id)).all()
+
+    names = {author_id: name for author_id, name, _ in rows}
+    book_counts = {author_id: count for author_id, _, count in rows}
+
+    keys = {author_id: normalize(name) for author_id, name in names.items()}
+
+    groups = find_duplicate_groups(
+        {author_id: trigrams(name) for author_id, name in names.items()},
+        keys, threshold, workers)
+
+    def entry(author_id):
+        return {"id": author_id, "name": names[author_id],
+                "books": book_counts[author_id]}
+
+    def group(survivor, members, similarity, auto_merge):
+        return {
+            "survivor": entry(survivor),
+            "duplicates": [entry(author_id) for author_id in members
+                           if author_id != survivor],
+            "similarity": round(similarity, 3),
+            "auto_merge": auto_merge,
+        }
+
+    auto_groups = []
+    review_groups = []
+    for members, similarity in groups:
+        by_key = defaultdict(list)
+        for author_id in members:
+            by_key[keys[author_id]].append(author_id)
+
+        # Survivor of each normalized name and the books it will hold
+        # once the equal names are merged into it
+        survivors = {}
+        for same_name in by_key.values():
+            survivor = min(same_name,
+                           key=lambda author_id: (-book_counts[author_id],
+                                                  author_id))
+            survivors[survivor] = sum(book_counts[author_id]
+                                      for author_id in same_name)
+            if len(same_name) > 1:
+                auto_groups.append(group(survivor, same_name, 1.0, True))
+
+        if len(survivors) > 1:
+            survivor = min(survivors,
+                           key=lambda author_id: (-survivors[author_id],
+                                                  author_id))
+            review_groups.append(group(survivor, sorted(survivors),
+                                       similarity, False))
+
+    return auto_groups + review_groups
+
+
+def find_duplicate_books(db, threshold: float = DEFAULT_BOOK_THRESHOLD,
+                         workers=None) -> list:
+    """
+    Finds books stored more than once, e.g. under both ISBN-10 and
+    ISBN-13, or with a slightly different title or author spelling when
+    at most one of them has a valid ISBN.
+
+    Parameters:
+        db: The database session object to interact with the database.
+        threshold (float): The minimum trigram similarity of title and
+                           author name.
+        workers (int, optional): The number of worker processes.
+
+    Returns:
+        list: A list of dicts, one per group, with:
+            - books: The books of the group (ID, ISBN, normalized ISBN,
+                     title, author ID and author name).
+            - similarity: The lowest similarity within the group; 1.0 for
+                          groups that only share an ISBN.
+    """
+
+    rows = db.session.execute(
+        select(Book.id, Book.isbn, Book.title, Book.author_id,
+               Author.name).select_from(Book).join(
+            Author, Book.author_id == Author.id)).all()
+
+    books = {row.id: row for row in rows}
+
+    # Author trigrams are prefixed so they never match title trigrams
+    shingles = {row.id: trigrams(row.title) | {
+        "a:" + gram for gram in trigrams(row.name)} for row in rows}
+    isbns = {row.id: normalize_isbn(row.isbn) for row in rows}
+
+    # Books with two different valid ISBNs are different editions or works
+    # (e.g. 'Dune' and 'Dune Messiah'), however similar their titles
+    groups = find_duplicate_groups(shingles, isbns, threshold, workers,
+                                   distinct_keys_differ=True)
+
+    return [{
+        "books": [{"id": book_id,
+                   "isbn": books[book_id].isbn,
+                   "isbn13": isbns[book_id],
+                   "title": books[book_id].title,
+                   "author_id": books[book_id].author_id,
+                   "author": books[book_id].name}
+                  for book_id in members],
+        "similarity": round(similarity, 3),
+    } for members, similarity in groups]
+
+
+def dedupe_report(db, workers=None) -> dict:
+    """
+    Builds the merge report of duplicate authors and books.
+
+    Parameters:
+        db: The database session object to interact with the database.
+        workers (int, optional): The number of worker processes.
+
+    Returns:
+        dict: A JSON-serializable report with 'authors' and 'books' lists
+              as returned by find_duplicate_authors and
+              find_duplicate_books.
+    """
+
+    return {
+        "authors": find_duplicate_authors(db, workers=workers),
+        "books": find_duplicate_books(db, workers=workers),
+    }
+
+
+def validate_merge_groups(db, groups: list) -> list:
+    """
+    Checks author groups of a (possibly hand-edited) report before any of
+    them is merged.
+
+    Every group needs a survivor and a list of duplicates, each with an
+    integer ID of an existing author. As groups are merged in order, an
+    author merged away by one group cannot appear in a later group.
+
+    Parameters:
+        db: The database session object to interact with the database.
+        groups (list): The author groups to be merged, in order.
+
+    Returns:
+        list: A list of (survivor ID, list of duplicate IDs) tuples.
+
+    Raises:
+        ValueError: If a group is malformed or names an author that does
+                    not exist or is merged away by an earlier group.
+    """
+
+    plan = []
+    for number, group in enumerate(groups, start=1):
+        try:
+            survivor_id = _author_id(group["survivor"])
+            duplicate_ids = [_author_id(duplicate)
+                             for duplicate in group["duplicates"]]
+        except (KeyError, TypeError, ValueError):
+            raise ValueError(
+                f"Author group {number}: expected a 'survivor' and a list "
+                f"of 'duplicates', each with an integer 'id'") from None
+        plan.append((survivor_id, duplicate_ids))
+
+    ids = {author_id for survivor_id, duplicate_ids in plan
+           for author_id in [survivor_id, *duplicate_ids]}
+    existing = set(db.session.scalars(
+        select(Author.id).where(Author.id.in_(ids))))
+
+    merged_away = {}
+    for number, (survivor_id, duplicate_ids) in enumerate(plan, start=1):
+        for author_id in [survivor_id, *duplicate_ids]:
+            if author_id not in existing:
+                raise ValueError(
+                    f"Author group {number}: author {author_id} does not "
+                    f"exist")
+            if author_id in merged_away:
+                raise ValueError(
+                    f"Author group {number}: author {author_id} is already "
+                    f"merged by group {merged_away[author_id]}")
+
+        for author_id in duplicate_ids:
+            if author_id != survivor_id:
+                merged_away[author_id] = number
+
+    return plan
+
+
+def _author_id(author: dict) -> int:
+    """
+    Returns the ID of an author entry of a report, rejecting booleans and
+    non-integral numbers that int() would accept.
+    """
+
+    author_id = author["id"]
+    if isinstance(author_id, bool) or not isinstance(author_id, (int, str)):
+        raise TypeError(author_id)
+    return int(author_id)
+
+
+def merge_duplicate_authors(db, report: dict,
+                            reviewed: bool = False) -> tuple:
+    """
+    Merges the duplicate author groups of a report into their survivors.
+
+    By default only the groups flagged 'auto_merge' (same normalized name)
+    are merged. A report whose groups an operator has checked and edited
+    (removing false matches, choosing survivors) is merged in full with
+    reviewed=True. All groups are validated before the first is merged.
+
+    Parameters:
+        db: The database session object to interact with the database.
+        report (dict): A report as returned by dedupe_report.
+        reviewed (bool): Whether every author group of the report has been
+                         reviewed and is to be merged.
+
+    Returns:
+        tuple: The number of groups merged and the number of books moved
+               to surviving authors.
+
+    Raises:
+        ValueError: If the report is malformed or a group cannot be
+                    merged (see validate_merge_groups).
+    """
+
+    try:
+        groups = [group for group in report["authors"]
+                  if reviewed or group.get("auto_merge")]
+    except (KeyError, TypeError, AttributeError):
+        raise ValueError("Expected a report with a list of 'authors' "
+                         "groups") from None
+
+    moved = 0
+    plan = validate_merge_groups(db, groups)
+    for survivor_id, duplicate_ids in plan:
+        moved += author_merge(db, survivor_id, duplicate_ids)
+    return len(plan), moved
@@ -125,3 +125,32 @@ def fetch_without_order(db):
                Author.name).select_from(
             Book).join(Author, Book.author_id == Author.id))
     return authors_of_books
+
+
+def fetch_books_by_ids(db, book_ids):
+    """
+    Fetches books and their authors by ID, keeping the order of the IDs.
+
+    Parameters:
+        db (SQLAlchemy session): The database session used to query the database.
+        book_ids (list): The IDs of the books to fetch, e.g. ranked by a
+                         fuzzy search.
+
+    Returns:
+        list: A list of tuples containing book details (ID, author ID, title,
+              cover) and the associated author's name, in the order of
+              book_ids. IDs that no longer exist are skipped.
+    """
+
+    if not book_ids:
+        return []
+
+    rows = db.session.execute(
+        select(Book.id, Book.author_id, Book.title, Book.cover,
+               Author.name).select_from(
+            Book).join(Author, Book.author_id == Author.id).filter(
+            Book.id.in_(book_ids))).all()
+
+    rows_by_id = {row.id: row for row in rows}
+    return [rows_by_id[book_id] for book_id in book_ids
+            if book_id in rows_by_id]
@@ -0,0 +1,59 @@
+import sys
+from datetime import date
+from pathlib import Path
+
+import pytest
+from flask import Flask
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from data_models import db as _db, Author, Book  # noqa: E402
+
+
+@pytest.fixture
+def db(tmp_path):
+    """
+    Provides the SQLAlchemy instance bound to a fresh SQLite database,
+    within an application context.
+    """
+
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = \
+        f"sqlite:///{tmp_path / 'library.sqlite3'}"
+    _db.init_app(app)
+
+    with app.app_context():
+        _db.create_all()
+        yield _db
+        _db.session.remove()
+
+
+@pytest.fixture
+def add_author(db):
+    """
+    Adds an author directly to the database and returns it.
+    """
+
+    def add(name):
+        author = Author(name=name, birth_date=date(1900, 1, 1))
+        db.session.add(author)
+        db.session.commit()
+        return author
+
+    return add
+
+
+@pytest.fixture
+def add_book(db):
+    """
+    Adds a book directly to the database (without the cover API) and
+    returns it.
+    """
+
+    def add(author, isbn, title):
+        book = Book(author_id=author.id, isbn=isbn, title=title, cover="")
+        db.session.add(book)
+        db.session.commit()
+        return book
+
+    return add
@@ -0,0 +1,181 @@
+import json
+import os
+import tempfile
+import threading
+import time
+from datetime import date
+from pathlib import Path
+
+import pytest
+
+# Point the app at a throwaway database before it is imported
+os.environ["LIBRARY_DATABASE_URI"] = \
+    f"sqlite:///{Path(tempfile.mkdtemp()) / 'library.sqlite3'}"
+
+import app as library_app  # noqa: E402
+from crud_util import author_add  # noqa: E402
+from data_models import db, Author, Book, CatalogChange  # noqa: E402
+
+
+@pytest.fixture
+def client():
+    """
+    Provides a test client for the app with an empty catalog and change
+    log.
+    """
+
+    with library_app.app.app_context():
+        for model in (CatalogChange, Book, Author):
+            db.session.execute(db.delete(model))
+        db.session.commit()
+
+    return library_app.app.test_client()
+
+
+def _add_authors(*names):
+    with library_app.app.app_context():
+        for name in names:
+            author_add(db, "1900-01-01", None, name)
+
+
+def test_changes_returns_changes_and_next_cursor(client):
+    _add_authors("Jane Austen", "Mary Shelley")
+
+    response = client.get("/changes?cursor=0")
+
+    assert response.status_code == 200
+    changes = response.json["changes"]
+    assert [change["payload"]["name"] for change in changes] == [
+        "Jane Austen", "Mary Shelley"]
+    assert response.json["cursor"] == changes[-1]["id"]
+
+
+def test_changes_resumes_from_cursor_with_limit(client):
+    _add_authors("Jane Austen", "Mary Shelley", "Emily Bronte")
+
+    first = client.get("/changes?limit=2").json
+    rest = client.get(f"/changes?cursor={first['cursor']}").json
+    empty = client.get(f"/changes?cursor={rest['cursor']}").json
+
+    assert len(first["changes"]) == 2
+    assert [change["payload"]["name"] for change in rest["changes"]] == [
+        "Emily Bronte"]
+    assert empty == {"changes": [], "cursor": rest["cursor"]}
+
+
+@pytest.mark.parametrize("query", [
+    "cursor=abc", "cursor=-1", "cursor=%C2%B2", "cursor=1.5",
+    "limit=0", "limit=-5", "limit=x",
+    "wait=-1", "wait=soon",
+])
+def test_changes_rejects_invalid_parameters(client, query):
+    assert client.get(f"/changes?{query}").status_code == 400
+
+
+def test_changes_wait_times_out_without_changes(client, monkeypatch):
+    monkeypatch.setattr(library_app, "CHANGES_POLL_INTERVAL", 0.05)
+
+    started = time.monotonic()
+    response = client.get("/changes?wait=1")
+
+    assert time.monotonic() - started >= 1
+    assert response.json == {"changes": [], "cursor": 0}
+
+
+def test_changes_wait_returns_when_a_change_is_recorded(client,
+                                                        monkeypatch):
+    monkeypatch.setattr(library_app, "CHANGES_POLL_INTERVAL", 0.05)
+    writer = threading.Timer(0.2, _add_authors, args=("Jane Austen",))
+    writer.start()
+
+    response = client.get("/changes?wait=10")
+    writer.join()
+
+    assert [change["payload"]["name"]
+            for change in response.json["changes"]] == ["Jane Austen"]
+
+
+def test_stream_resumes_from_last_event_id(client):
+    _add_authors("Jane Austen", "Mary Shelley")
+    first_id = client.get("/changes").json["changes"][0]["id"]
+
+    response = client.get("/changes/stream",
+                          headers={"Last-Event-ID": str(first_id)})
+    event = next(iter(response.response)).decode()
+    response.close()
+
+    assert response.mimetype == "text/event-stream"
+    assert event.startswith(f"id: {first_id + 1}\nevent: change\n")
+    assert "Mary Shelley" in event
+
+
+@pytest.mark.parametrize("last_event_id", ["²", "-1", "x"])
+def test_stream_rejects_invalid_last_event_id(client, last_event_id):
+    response = client.get("/changes/stream",
+                          headers={"Last-Event-ID": last_event_id})
+
+    assert response.status_code == 400
+
+
+def test_search_adds_fuzzy_matches_once_the_index_is_loaded(client,
+                                                            monkeypatch):
+    monkeypatch.setattr(library_app, "search_index", None)
+    monkeypatch.setattr(library_app, "search_index_thread", None)
+    with library_app.app.app_context():
+        author = Author(name="Jane Austen", birth_date=date(1775, 12, 16))
+        db.session.add(author)
+        db.session.flush()
+        db.session.add(Book(author_id=author.id, isbn="9780141439518",
+                            title="Pride and Prejudice", cover=""))
+        db.session.commit()
+
+    before = client.post("/search", data={"title": "Prid and Prejudise"})
+    library_app.search_index_thread.join()
+    after = client.post("/search", data={"title": "Prid and Prejudise"})
+
+    assert "Pride and Prejudice" not in before.get_data(as_text=True)
+    assert "Pride and Prejudice" in after.get_data(as_text=True)
+
+
+def _dedupe(*args):
+    return library_app.app.test_cli_runner().invoke(
+        library_app.dedupe, args)
+
+
+def test_dedupe_merge_from_validates_every_group_first(client, tmp_path):
+    _add_authors("Henry James", "HENRY JAMES")
+    with library_app.app.app_context():
+        ids = db.session.scalars(db.select(Author.id).order_by(
+            Author.id)).all()
+    report = tmp_path / "report.json"
+    report.write_text(json.dumps({"authors": [
+        {"survivor": {"id": ids[0]}, "duplicates": [{"id": ids[1]}]},
+        {"survivor": {"id": ids[0]}, "duplicates": [{"id": ids[1] + 1}]},
+    ]}))
+
+    result = _dedupe("--merge-from", str(report))
+
+    assert result.exit_code == 1
+    assert f"author {ids[1] + 1} does not exist" in result.output
+    with library_app.app.app_context():
+        assert len(db.session.scalars(db.select(Author)).all()) == 2
+
+
+def test_dedupe_merge_from_rejects_invalid_json(client, tmp_path):
+    report = tmp_path / "report.json"
+    report.write_text("{")
+
+    result = _dedupe("--merge-from", str(report))
+
+    assert result.exit_code == 1
+    assert "Nothing merged from" in result.output
+
+
+def test_dedupe_rejects_merge_with_merge_from(client, tmp_path):
+    report = tmp_path / "report.json"
+    report.write_text(json.dumps({"authors": []}))
+
+    result = _dedupe("--merge", "--merge-from", str(report))
+
+    assert result.exit_code == 2
+    assert "--merge cannot be combined with --merge-from" in result.output
@@ -0,0 +1,35 @@
+from changelog_util import seed_change_log, fetch_changes, record_change
+
+
+def test_seed_change_log_records_existing_rows(db, add_author, add_book):
+    author = add_author("Jane Austen")
+    book = add_book(author, "9780141439518", "Emma")
+
+    assert seed_change_log(db) == 2
+
+    assert [(change.entity, change.entity_id, change.operation)
+            for change in fetch_changes(db, 0)] == [
+        ("author", author.id, "insert"),
+        ("book", book.id, "insert"),
+    ]
+
+
+def test_seed_change_log_skips_non_empty_log(db, add_author):
+    add_author("Jane Austen")
+    record_change(db, "author", 1, "delete", {})
+    db.session.commit()
+
+    assert seed_change_log(db) == 0
+    assert len(fetch_changes(db, 0)) == 1
+
+
+def test_fetch_changes_pages_from_cursor(db):
+    for entity_id in range(1, 6):
+        record_change(db, "author", entity_id, "insert", {})
+    db.session.commit()
+
+    first = fetch_changes(db, 0, limit=2)
+    rest = fetch_changes(db, first[-1].id, limit=10)
+
+    assert [change.entity_id for change in first] == [1, 2]
+    assert [change.entity_id for change in rest] == [3, 4, 5]
@@ -0,0 +1,142 @@
+import json
+
+import pytest
+from sqlalchemy.exc import IntegrityError
+
+import crud_util
+from changelog_util import fetch_changes
+from crud_util import author_merge, author_add, book_add, book_delete, \
+    author_delete
+from data_models import Author, Book
+
+
+def test_author_merge_moves_books_to_survivor(db, add_author, add_book):
+    survivor = add_author("Savanna de Dios")
+    duplicate = add_author("SAVANNA DE DIOS")
+    kept = add_book(survivor, "9780061120084", "To Kill a Mockingbird")
+    moved = add_book(duplicate, "9789999098823", "Ten Apples Up on Top!")
+
+    assert author_merge(db, survivor.id, [duplicate.id]) == 1
+
+    assert db.session.get(Author, duplicate.id) is None
+    assert db.session.get(Book, moved.id).author_id == survivor.id
+    assert db.session.get(Book, kept.id).author_id == survivor.id
+
+
+def test_author_merge_logs_update_and_delete(db, add_author, add_book):
+    survivor = add_author("Savanna de Dios")
+    duplicate = add_author("SAVANNA DE DIOS")
+    book = add_book(duplicate, "9789999098823", "Ten Apples Up on Top!")
+
+    author_merge(db, survivor.id, [duplicate.id])
+
+    changes = [(change.entity, change.entity_id, change.operation,
+                json.loads(change.payload)) for change in fetch_changes(db, 0)]
+
+    assert [change[:3] for change in changes] == [
+        ("book", book.id, "update"),
+        ("author", duplicate.id, "delete"),
+    ]
+    update = changes[0][3]
+    assert update["before"]["author_id"] == duplicate.id
+    assert update["after"]["author_id"] == survivor.id
+    assert changes[1][3]["name"] == "SAVANNA DE DIOS"
+
+
+def test_author_merge_ignores_survivor_in_duplicates(db, add_author,
+                                                     add_book):
+    survivor = add_author("Savanna de Dios")
+    add_book(survivor, "9780061120084", "To Kill a Mockingbird")
+
+    assert author_merge(db, survivor.id, [survivor.id]) == 0
+    assert db.session.get(Author, survivor.id) is not None
+    assert fetch_changes(db, 0) == []
+
+
+def test_author_merge_rejects_unknown_author(db, add_author):
+    survivor = add_author("Savanna de Dios")
+
+    with pytest.raises(ValueError):
+        author_merge(db, survivor.id, [survivor.id + 1])
+
+
+def _logged(db):
+    return [(change.entity, change.entity_id, change.operation,
+             json.loads(change.payload)) for change in fetch_changes(db, 0)]
+
+
+def test_author_add_logs_insert(db):
+    author_add(db, "1775-12-16", None, "Jane Austen")
+
+    author = db.session.execute(
+        db.select(Author).filter_by(name="Jane Austen")).scalar_one()
+    [(entity, entity_id, operation, payload)] = _logged(db)
+
+    assert (entity, entity_id, operation) == ("author", author.id, "insert")
+    assert payload["name"] == "Jane Austen"
+    assert payload["birth_date"] == "1775-12-16"
+
+
+def test_author_add_failure_logs_nothing(db, add_author):
+    add_author("Jane Austen")
+
+    with pytest.raises(IntegrityError):
+        author_add(db, "1775-12-16", None, "Jane Austen")
+    db.session.rollback()
+
+    assert _logged(db) == []
+
+
+def test_book_add_logs_insert_with_int_author_id(db, add_author,
+                                                 monkeypatch):
+    monkeypatch.setattr(crud_util, "get_book_cover_from_api",
+                        lambda isbn: "cover.jpg")
+    author = add_author("Jane Austen")
+
+    book_add(db, str(author.id), "9780141439518", "2000-01-01", "Emma")
+
+    [(entity, _, operation, payload)] = _logged(db)
+    assert (entity, operation) == ("book", "insert")
+    assert payload["author_id"] == author.id
+    assert payload["title"] == "Emma"
+
+
+def test_book_add_failure_logs_nothing(db, add_author, add_book,
+                                       monkeypatch):
+    monkeypatch.setattr(crud_util, "get_book_cover_from_api",
+                        lambda isbn: "cover.jpg")
+    author = add_author("Jane Austen")
+    add_book(author, "9780141439518", "Emma")
+
+    with pytest.raises(IntegrityError):
+        book_add(db, author.id, "9780141439518", "2000-01-01", "Emma")
+    db.session.rollback()
+
+    assert _logged(db) == []
+    assert db.session.scalars(db.select(Book)).all() != []
+
+
+def test_book_delete_logs_delete(db, add_author, add_book):
+    author = add_author("Jane Austen")
+    book = add_book(author, "9780141439518", "Emma")
+
+    book_delete(db, book.id)
+
+    [(entity, entity_id, operation, payload)] = _logged(db)
+    assert (entity, entity_id, operation) == ("book", book.id, "delete")
+    assert payload["isbn"] == "9780141439518"
+
+
+def test_author_delete_logs_cascaded_books_before_author(db, add_author,
+                                                         add_book):
+    author = add_author("Jane Austen")
+    first = add_book(author, "9780141439518", "Emma")
+    second = add_book(author, "9780141439587", "Persuasion")
+
+    author_delete(db, author.id)
+
+    logged = [change[:3] for change in _logged(db)]
+    assert sorted(logged[:2]) == [("book", first.id, "delete"),
+                                  ("book", second.id, "delete")]
+    assert logged[2] == ("author", author.id, "delete")
+    assert db.session.scalars(db.select(Book)).all() == []
@@ -0,0 +1,187 @@
+import pytest
+
+from data_models import Author
+from dedupe_util import normalize_isbn, minhash, lsh_candidates, cluster, \
+    find_duplicate_groups, find_duplicate_authors, find_duplicate_books, \
+    merge_duplicate_authors, validate_merge_groups, NUM_PERMUTATIONS
+from trigram_util import trigrams
+
+
+@pytest.mark.parametrize("isbn, expected", [
+    ("0-06-112008-1", "9780061120084"),
+    ("0061120081", "9780061120084"),
+    ("0-8044-2957-X", "9780804429573"),
+    ("080442957x", "9780804429573"),
+    ("978-0-06-112008-4", "9780061120084"),
+    ("9780061120084", "9780061120084"),
+])
+def test_normalize_isbn_returns_isbn13(isbn, expected):
+    assert normalize_isbn(isbn) == expected
+
+
+@pytest.mark.parametrize("isbn", [
+    "0-06-112008-2",  # Wrong ISBN-10 check digit
+    "9780061120085",  # Wrong ISBN-13 check digit
+    "06112008X1",  # X only allowed as check digit
+    "123",
+    "",
+    None,
+])
+def test_normalize_isbn_rejects_invalid(isbn):
+    assert normalize_isbn(isbn) is None
+
+
+def test_minhash_of_equal_sets_is_equal():
+    first = minhash(trigrams("One Hundred Years of Solitude"))
+    second = minhash(trigrams("one hundred years of solitude!"))
+
+    assert len(first) == NUM_PERMUTATIONS
+    assert first == second
+
+
+def test_lsh_candidates_pairs_every_member_of_a_bucket():
+    signature = (0,) * NUM_PERMUTATIONS
+
+    assert lsh_candidates({1: signature, 2: signature, 3: signature}) == {
+        (1, 2), (1, 3), (2, 3)}
+
+
+def test_cluster_groups_transitively():
+    groups = cluster([1, 2, 3, 4, 5], {(1, 2): 0.9, (2, 3): 0.7})
+
+    assert groups == [([1, 2, 3], 0.7)]
+
+
+def test_find_duplicate_groups_blocks_on_exact_keys():
+    records = {1: {"abc"}, 2: {"xyz"}, 3: {"def"}, 4: {"uvw"}}
+    keys = {1: "9780061120084", 2: "9780061120084", 3: None, 4: None}
+
+    groups = find_duplicate_groups(records, keys, threshold=0.7, workers=1)
+
+    assert groups == [([1, 2], 1.0)]
+
+
+def test_find_duplicate_groups_finds_near_duplicates():
+    names = {1: "Gabriel Garcia Marquez", 2: "Gabriel Garcia Marques",
+             3: "Robert T. Kiyosaki"}
+
+    groups = find_duplicate_groups(
+        {key: trigrams(name) for key, name in names.items()}, {},
+        threshold=0.6, workers=1)
+
+    assert [members for members, _ in groups] == [[1, 2]]
+
+
+def test_find_duplicate_groups_can_keep_distinct_keys_apart():
+    records = {1: trigrams("The Lord of the Rings"),
+               2: trigrams("The Lord of the Rings"),
+               3: trigrams("Dune"),
+               4: trigrams("Dune")}
+    keys = {1: "9780618640157", 2: "9780261102385", 3: "9780441172719"}
+
+    linked = find_duplicate_groups(records, keys, threshold=0.7, workers=1)
+    kept_apart = find_duplicate_groups(records, keys, threshold=0.7,
+                                       workers=1, distinct_keys_differ=True)
+
+    assert linked == [([1, 2], 1.0), ([3, 4], 1.0)]
+    assert kept_apart == [([3, 4], 1.0)]
+
+
+def test_find_duplicate_books_skips_different_valid_isbns(
+        db, add_author, add_book):
+    herbert = add_author("Frank Herbert")
+    add_book(herbert, "9780441172719", "Dune")
+    add_book(herbert, "9780441013593", "Dune")
+    austen = add_author("Jane Austen")
+    emma = add_book(austen, "9780141439587", "Emma")
+    copy = add_book(austen, "unknown", "Emma")
+
+    groups = find_duplicate_books(db, workers=1)
+
+    assert [[book["id"] for book in group["books"]]
+            for group in groups] == [[emma.id, copy.id]]
+
+
+def test_find_duplicate_authors_flags_only_normalized_matches(
+        db, add_author, add_book):
+    survivor = add_author("Savanna de Dios")
+    add_book(survivor, "9780061120084", "To Kill a Mockingbird")
+    add_author("SAVANNA DE DIOS")
+    add_author("Henry James")
+    add_author("Henry Jameson")
+
+    report = find_duplicate_authors(db, workers=1)
+    flags = {group["survivor"]["name"]: group["auto_merge"]
+             for group in report}
+
+    assert flags == {"Savanna de Dios": True, "Henry James": False}
+
+    assert merge_duplicate_authors(db, {"authors": report}) == (1, 0)
+
+    names = {author.name for author in db.session.scalars(db.select(Author))}
+    assert names == {"Savanna de Dios", "Henry James", "Henry Jameson"}
+
+
+def test_find_duplicate_authors_splits_equal_names_from_near_matches(
+        db, add_author, add_book):
+    james = add_author("Henry James")
+    shouting = add_author("HENRY JAMES")
+    add_book(shouting, "9780141441641", "The Portrait of a Lady")
+    jameson = add_author("Henry Jameson")
+
+    report = find_duplicate_authors(db, workers=1)
+    groups = [(group["survivor"]["id"],
+               [duplicate["id"] for duplicate in group["duplicates"]],
+               group["auto_merge"]) for group in report]
+
+    assert groups == [(shouting.id, [james.id], True),
+                      (shouting.id, [jameson.id], False)]
+
+    assert merge_duplicate_authors(db, {"authors": report}) == (1, 0)
+
+    names = {author.name for author in db.session.scalars(db.select(Author))}
+    assert names == {"HENRY JAMES", "Henry Jameson"}
+
+
+def _group(survivor_id, *duplicate_ids):
+    return {"survivor": {"id": survivor_id},
+            "duplicates": [{"id": author_id} for author_id in duplicate_ids]}
+
+
+def test_validate_merge_groups_allows_chained_merges(db, add_author):
+    first, second, third = (add_author(name) for name in
+                            ("Henry James", "HENRY JAMES", "Henry Jameson"))
+
+    plan = validate_merge_groups(db, [_group(first.id, second.id),
+                                      _group(str(third.id), first.id)])
+
+    assert plan == [(first.id, [second.id]), (third.id, [first.id])]
+
+
+@pytest.mark.parametrize("groups, message", [
+    ([{"survivor": {"id": 1}}], "expected a 'survivor'"),
+    ([_group(1, "one")], "expected a 'survivor'"),
+    ([_group(1, True)], "expected a 'survivor'"),
+    ([_group(1, 99)], "author 99 does not exist"),
+    ([_group(1, 2), _group(3, 2)], "author 2 is already merged by group 1"),
+    ([_group(1, 2), _group(2, 3)], "author 2 is already merged by group 1"),
+])
+def test_validate_merge_groups_rejects_invalid_groups(db, add_author,
+                                                      groups, message):
+    for name in ("Henry James", "HENRY JAMES", "Henry Jameson"):
+        add_author(name)
+
+    with pytest.raises(ValueError, match=message):
+        validate_merge_groups(db, groups)
+
+
+def test_merge_duplicate_authors_validates_before_merging(db, add_author):
+    survivor = add_author("Henry James")
+    duplicate = add_author("HENRY JAMES")
+    report = {"authors": [_group(survivor.id, duplicate.id),
+                          _group(survivor.id, duplicate.id + 1)]}
+
+    with pytest.raises(ValueError):
+        merge_duplicate_authors(db, report, reviewed=True)
+
+    assert db.session.get(Author, duplicate.id) is not None
@@ -0,0 +1,197 @@
+import json
+
+import pytest
+
+import crud_util
+import trigram_util
+from crud_util import author_add, book_add, book_delete, author_merge
+from data_models import Author, Book
+from trigram_util import TrigramIndex, normalize, trigrams
+
+
+@pytest.fixture
+def catalog(db, monkeypatch):
+    """
+    Provides add_author(name) and add_book(author_id, isbn, title)
+    helpers that go through crud_util, so every write is recorded in the
+    change log, and return the new row's ID.
+    """
+
+    monkeypatch.setattr(crud_util, "get_book_cover_from_api",
+                        lambda isbn: "")
+
+    def add_author(name):
+        author_add(db, "1900-01-01", None, name)
+        return _id_of(db, Author, Author.name, name)
+
+    def add_book(author_id, isbn, title):
+        book_add(db, author_id, isbn, "2000-01-01", title)
+        return _id_of(db, Book, Book.title, title)
+
+    return add_author, add_book
+
+
+def _id_of(db, model, column, value):
+    return db.session.execute(
+        db.select(model.id).where(column == value)).scalar_one()
+
+
+def _ids(results):
+    return [book_id for book_id, _ in results]
+
+
+def test_normalize_strips_accents_case_and_punctuation():
+    assert normalize("Gabriel García-Márquez!") == "gabriel garcia marquez"
+
+
+def test_trigrams_pad_each_word():
+    assert trigrams("Ab c") == {"  a", " ab", "ab ", "  c", " c "}
+
+
+def test_search_ranks_full_matches_first(db, catalog):
+    add_author, add_book = catalog
+    author = add_author("Frank Herbert")
+    messiah = add_book(author, "9780593098233", "Dune Messiah")
+    dune = add_book(author, "9780441172719", "Dune")
+
+    index = TrigramIndex.build(db)
+    results = index.search("dune")
+
+    assert _ids(results) == [dune, messiah]
+    assert [similarity for _, similarity in results] == [1.0, 1.0]
+
+
+def test_search_finds_misspelled_titles_above_threshold(db, catalog):
+    add_author, add_book = catalog
+    author = add_author("J. R. R. Tolkien")
+    rings = add_book(author, "9780618640157", "The Lord of the Rings")
+    add_book(author, "9780261102217", "The Hobbit")
+
+    index = TrigramIndex.build(db)
+
+    [(book_id, similarity)] = index.search("lord of teh rigns")
+    assert book_id == rings
+    assert 0.5 <= similarity < 1.0
+    assert index.search("lord of teh rigns", threshold=0.9) == []
+    assert index.search("xyzzy") == []
+
+
+def test_search_matches_author_names(db, catalog):
+    add_author, add_book = catalog
+    author = add_author("Gabriel Garcia Marquez")
+    book = add_book(author, "9780060883287",
+                    "One Hundred Years of Solitude")
+
+    index = TrigramIndex.build(db)
+
+    assert _ids(index.search("Gabriel Garcia Marques")) == [book]
+
+
+def test_search_respects_limit(db, catalog):
+    add_author, add_book = catalog
+    author = add_author("Frank Herbert")
+    for number in range(5):
+        add_book(author, f"978044117271{number}", f"Dune {number}")
+
+    index = TrigramIndex.build(db)
+
+    assert len(index.search("dune", limit=3)) == 3
+
+
+def test_sync_applies_inserts_and_deletes(db, catalog):
+    add_author, add_book = catalog
+    index = TrigramIndex.build(db)
+    author = add_author("Frank Herbert")
+    dune = add_book(author, "9780441172719", "Dune")
+
+    assert index.sync(db) == 2
+    assert _ids(index.search("dune")) == [dune]
+
+    book_delete(db, dune)
+
+    assert index.sync(db) == 1
+    assert index.search("dune") == []
+    assert index.sync(db) == 0
+
+
+def test_sync_applies_author_merge_updates(db, catalog):
+    add_author, add_book = catalog
+    survivor = add_author("Savanna de Dios")
+    duplicate = add_author("Savana Dios")
+    book = add_book(duplicate, "9789999098823", "Ten Apples Up on Top!")
+    index = TrigramIndex.build(db)
+
+    author_merge(db, survivor, [duplicate])
+
+    assert index.sync(db) == 2
+    assert _ids(index.search("Savanna de Dios")) == [book]
+    assert index.author_books == {survivor: {book}}
+    assert index.search("Savana Dios", threshold=1.0) == []
+
+
+def test_sync_compacts_pending_changes(db, catalog, monkeypatch):
+    monkeypatch.setattr(trigram_util, "COMPACT_AFTER_CHANGES", 1)
+    add_author, add_book = catalog
+    index = TrigramIndex.build(db)
+    author = add_author("Frank Herbert")
+    dune = add_book(author, "9780441172719", "Dune")
+
+    index.sync(db)
+
+    assert not index.title_postings.added
+    assert _ids(index.search("dune")) == [dune]
+
+
+def test_save_and_load_round_trip(db, catalog, tmp_path):
+    add_author, add_book = catalog
+    author = add_author("Frank Herbert")
+    add_book(author, "9780441172719", "Dune")
+    index = TrigramIndex.build(db)
+    add_book(author, "9780593098233", "Dune Messiah")
+    index.sync(db)  # Leaves pending changes for save() to merge
+
+    path = tmp_path / "search_index.bin"
+    index.save(path)
+    loaded = TrigramIndex.load(path)
+
+    assert loaded.cursor == index.cursor
+    assert loaded.author_books == index.author_books
+    assert loaded.search("dune") == index.search("dune")
+    assert loaded.search("frank herbert") == index.search("frank herbert")
+
+
+def _saved_index(db, catalog, path):
+    add_author, add_book = catalog
+    add_book(add_author("Frank Herbert"), "9780441172719", "Dune")
+    TrigramIndex.build(db).save(path)
+    return path.read_bytes()
+
+
+def test_load_returns_none_for_missing_file(tmp_path):
+    assert TrigramIndex.load(tmp_path / "missing.bin") is None
+
+
+def test_load_returns_none_for_truncated_file(db, catalog, tmp_path):
+    path = tmp_path / "search_index.bin"
+    data = _saved_index(db, catalog, path)
+    path.write_bytes(data[:-1])
+
+    assert TrigramIndex.load(path) is None
+
+
+def test_load_returns_none_for_trailing_data(db, catalog, tmp_path):
+    path = tmp_path / "search_index.bin"
+    data = _saved_index(db, catalog, path)
+    path.write_bytes(data + b"\0\0\0\0")
+
+    assert TrigramIndex.load(path) is None
+
+
+def test_load_returns_none_for_other_version(db, catalog, tmp_path):
+    path = tmp_path / "search_index.bin"
+    header, _, arrays = _saved_index(db, catalog, path).partition(b"\n")
+    header = json.loads(header)
+    header["version"] = trigram_util.INDEX_FORMAT_VERSION - 1
+    path.write_bytes(json.dumps(header).encode() + b"\n" + arrays)
+
+    assert TrigramIndex.load(path) is None
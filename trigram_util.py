@@ -0,0 +1,666 @@
+import heapq
+import json
+import math
+import os
+import re
+import sys
+import tempfile
+import threading
+import unicodedata
+from array import array
+from bisect import bisect_left
+from collections import Counter, defaultdict
+
+from sqlalchemy import select, func
+
+from changelog_util import fetch_changes, ENTITY_AUTHOR, ENTITY_BOOK, \
+    OPERATION_INSERT, OPERATION_UPDATE, OPERATION_DELETE
+from data_models import Author, Book, CatalogChange
+
+"""
+Minimum share of a query's trigrams that a title or author name must
+contain for the book to be returned by a fuzzy search.
+"""
+DEFAULT_SIMILARITY_THRESHOLD = 0.5
+
+"""
+Version of the on-disk index format; files with another version are
+ignored and the index is rebuilt from the database.
+"""
+INDEX_FORMAT_VERSION = 3
+
+# Postings are stored on disk as arrays of unsigned 32-bit integers
+ARRAY_TYPECODE = "I"
+
+# Order in which the integer arrays follow the JSON header of an index file
+INDEX_ARRAYS = ["title_lengths", "title_ids",
+                "author_lengths", "author_ids",
+                "title_sizes", "author_sizes",
+                "book_author_ids", "book_lengths", "book_ids"]
+
+# Trigram counts per document are kept in memory as unsigned 16-bit
+# integers indexed by ID
+SIZE_TYPECODE = "H"
+MAX_SIZE = (1 << 16) - 1
+
+"""
+Upper bound on the documents scored per query. Candidates are taken from
+the query's rarest trigrams first, so the cap only drops matches that
+rely on very common trigrams.
+"""
+MAX_CANDIDATES = 5000
+
+# Sorted arrays up to SCAN_FACTOR times the number of candidates are
+# scanned; longer ones are binary-searched per candidate.
+SCAN_FACTOR = 16
+
+"""
+Number of writes after which sync() merges the pending changes of a
+postings map into new sorted arrays.
+"""
+COMPACT_AFTER_CHANGES = 10000
+
+NON_ALPHANUMERIC = re.compile(r"[^0-9a-z]+")
+
+
+def normalize(text: str) -> str:
+    """
+    Normalizes a title or name for fuzzy matching.
+
+    Accents are removed, the text is lower-cased and every run of
+    non-alphanumeric characters is replaced by a single space.
+
+    Parameter:
+        text (str): The text to be normalized.
+
+    Returns:
+        str: The normalized text.
+    """
+
+    decomposed = unicodedata.normalize("NFKD", text or "")
+    without_accents = "".join(
+        char for char in decomposed if not unicodedata.combining(char))
+
+    return NON_ALPHANUMERIC.sub(" ", without_accents.lower()).strip()
+
+
+def trigrams(text: str) -> set:
+    """
+    Splits a text into the set of its trigrams.
+
+    Every word is padded with two leading and one trailing space, so short
+    words and word beginnings carry more weight (as in PostgreSQL pg_trgm).
+
+    Parameter:
+        text (str): The text to be split.
+
+    Returns:
+        set: The set of trigrams of the normalized text.
+    """
+
+    result = set()
+    for word in normalize(text).split():
+        padded = f"  {word} "
+        result.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return result
+
+
+class TrigramIndex:
+    """
+    In-memory trigram index over book titles and author names.
+
+    The index maps every trigram to the IDs of the books (by title) and
+    authors (by name) containing it. It remembers the ID of the last change
+    log entry it has applied, so it is kept up to date incrementally by
+    replaying the change log with sync().
+
+    Attributes:
+        cursor (int): The ID of the last change log entry applied.
+        title_postings (Postings): Trigram -> book IDs.
+        author_postings (Postings): Trigram -> author IDs.
+        title_sizes (array): Number of trigrams in each book's title,
+                             indexed by book ID (0 if absent).
+        author_sizes (array): Number of trigrams in each author's name,
+                              indexed by author ID (0 if absent).
+        author_books (dict): Author ID -> set of the author's book IDs.
+    """
+
+    def __init__(self):
+        self.cursor = 0
+        self.title_postings = Postings()
+        self.author_postings = Postings()
+        self.title_sizes = array(SIZE_TYPECODE)
+        self.author_sizes = array(SIZE_TYPECODE)
+        self.author_books = defaultdict(set)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def build(cls, db):
+        """
+        Builds the index from all books and authors in the database.
+
+        Parameter:
+            db: The database session object to interact with the database.
+
+        Returns:
+            TrigramIndex: The populated index.
+        """
+
+        index = cls()
+
+        # Read the cursor before the catalog: changes committed during the
+        # scan are replayed by sync(), and replaying them is idempotent.
+        index.cursor = db.session.execute(
+            select(func.coalesce(func.max(CatalogChange.id), 0))).scalar()
+
+        # Rows are read in ID order, so every posting list is built
+        # already sorted and goes straight into an array.
+        author_lists = defaultdict(list)
+        for author_id, name in db.session.execute(
+                select(Author.id, Author.name).order_by(Author.id)):
+            grams = trigrams(name)
+            for gram in grams:
+                author_lists[gram].append(author_id)
+            _set_size(index.author_sizes, author_id, len(grams))
+
+        title_lists = defaultdict(list)
+        for book_id, author_id, title in db.session.execute(
+                select(Book.id, Book.author_id, Book.title).order_by(
+                    Book.id)):
+            grams = trigrams(title)
+            for gram in grams:
+                title_lists[gram].append(book_id)
+            _set_size(index.title_sizes, book_id, len(grams))
+            index.author_books[author_id].add(book_id)
+
+        index.author_postings = Postings(
+            {gram: array(ARRAY_TYPECODE, ids)
+             for gram, ids in author_lists.items()})
+        index.title_postings = Postings(
+            {gram: array(ARRAY_TYPECODE, ids)
+             for gram, ids in title_lists.items()})
+        return index
+
+    @classmethod
+    def load(cls, path):
+        """
+        Loads an index previously written with save().
+
+        The file is only parsed as a JSON header and integer arrays, never
+        executed, and a missing, truncated, corrupt or outdated file is
+        treated as a cache miss.
+
+        Parameter:
+            path (str | Path): The file the index was saved to.
+
+        Returns:
+            TrigramIndex: The loaded index, or None if the file does not
+                          exist, cannot be read or was written in another
+                          format version.
+        """
+
+        try:
+            with open(path, "rb") as file:
+                header = json.loads(file.readline())
+                if (header.get("version") != INDEX_FORMAT_VERSION
+                        or header["itemsize"] != array(
+                            ARRAY_TYPECODE).itemsize):
+                    return None
+
+                arrays = {}
+                for name in INDEX_ARRAYS:
+                    values = array(ARRAY_TYPECODE)
+                    values.fromfile(file, header["counts"][name])
+                    if header["byteorder"] != sys.byteorder:
+                        values.byteswap()
+                    arrays[name] = values
+
+                if file.read(1):
+                    return None  # Trailing data: not a file save() wrote
+
+            index = cls()
+            index.cursor = header["cursor"]
+            index.title_postings = Postings(dict(_unflatten(
+                header["title_grams"], arrays["title_lengths"],
+                arrays["title_ids"])))
+            index.author_postings = Postings(dict(_unflatten(
+                header["author_grams"], arrays["author_lengths"],
+                arrays["author_ids"])))
+            index.title_sizes = array(SIZE_TYPECODE, arrays["title_sizes"])
+            index.author_sizes = array(SIZE_TYPECODE, arrays["author_sizes"])
+            index.author_books.update(
+                (author_id, set(ids)) for author_id, ids in _unflatten(
+                    arrays["book_author_ids"], arrays["book_lengths"],
+                    arrays["book_ids"]))
+        except (OSError, EOFError, ValueError, KeyError, TypeError,
+                AttributeError, OverflowError) as e:
+            if not isinstance(e, FileNotFoundError):
+                print(f"Ignoring unreadable search index {path}: {e}")
+            return None
+
+        return index
+
+    def save(self, path):
+        """
+        Writes the index to disk.
+
+        The file holds a JSON header followed by the postings and sizes as
+        sorted arrays of 32-bit integers, which keeps it compact and fast
+        to load. It is written to a temporary file that then replaces the
+        target, so a crash never leaves a partially written index behind.
+
+        Parameter:
+            path (str | Path): The file the index is written to.
+
+        Returns:
+            None
+        """
+
+        with self._lock:
+            self.title_postings.compact()
+            self.author_postings.compact()
+
+            title_grams = sorted(self.title_postings.base)
+            author_grams = sorted(self.author_postings.base)
+            author_ids = sorted(self.author_books)
+
+            arrays = {}
+            arrays["title_lengths"], arrays["title_ids"] = _flatten(
+                self.title_postings.base, title_grams)
+            arrays["author_lengths"], arrays["author_ids"] = _flatten(
+                self.author_postings.base, author_grams)
+            arrays["title_sizes"] = array(ARRAY_TYPECODE, self.title_sizes)
+            arrays["author_sizes"] = array(ARRAY_TYPECODE, self.author_sizes)
+            arrays["book_author_ids"] = array(ARRAY_TYPECODE, author_ids)
+            arrays["book_lengths"], arrays["book_ids"] = _flatten(
+                self.author_books, author_ids)
+
+            header = {
+                "version": INDEX_FORMAT_VERSION,
+                "cursor": self.cursor,
+                "itemsize": array(ARRAY_TYPECODE).itemsize,
+                "byteorder": sys.byteorder,
+                "title_grams": title_grams,
+                "author_grams": author_grams,
+                "counts": {name: len(arrays[name]) for name in INDEX_ARRAYS},
+            }
+
+        directory = os.path.dirname(os.path.abspath(path))
+        with tempfile.NamedTemporaryFile(
+                "wb", dir=directory, prefix=".search_index-",
+                delete=False) as file:
+            temp_path = file.name
+            try:
+                file.write(json.dumps(header).encode() + b"\n")
+                for name in INDEX_ARRAYS:
+                    arrays[name].tofile(file)
+            except BaseException:
+                file.close()
+                os.remove(temp_path)
+                raise
+
+        os.replace(temp_path, path)
+
+    def sync(self, db):
+        """
+        Applies the change log entries recorded since the last sync.
+
+        Parameter:
+            db: The database session object to interact with the database.
+
+        Returns:
+            int: The number of change log entries applied.
+        """
+
+        applied = 0
+        with self._lock:
+            while True:
+                changes = fetch_changes(db, self.cursor)
+                if not changes:
+                    break
+
+                for change in changes:
+                    self._apply(change)
+                    self.cursor = change.id
+                applied += len(changes)
+
+            for postings in (self.title_postings, self.author_postings):
+                if postings.pending >= COMPACT_AFTER_CHANGES:
+                    postings.compact()
+
+        return applied
+
+    def search(self, query: str,
+               threshold: float = DEFAULT_SIMILARITY_THRESHOLD,
+               limit: int = 50) -> list:
+        """
+        Finds the books whose title or author name is similar to a query.
+
+        The similarity is the share of the query's trigrams found in the
+        title or author name, so a misspelled word still matches a long
+        title; ties are ranked by the Jaccard index of the trigram sets,
+        which favours the closest overall match.
+
+        Only books that share at least one of the query's rarest trigrams
+        can reach the threshold, and at most MAX_CANDIDATES of them are
+        scored, so queries made only of common words stay fast. Scoring
+        runs on a snapshot of the postings taken under the lock, so
+        searches run concurrently with each other and with sync().
+
+        Parameters:
+            query (str): The (possibly misspelled) title or author name.
+            threshold (float): The minimum similarity of a result.
+            limit (int): The maximum number of results.
+
+        Returns:
+            list: A list of (book ID, similarity) tuples, most similar
+                  first.
+        """
+
+        query_grams = trigrams(query)
+        if not query_grams:
+            return []
+
+        with self._lock:
+            titles = self.title_postings.snapshot(query_grams)
+            authors = self.author_postings.snapshot(query_grams)
+
+        scores = dict(_match(query_grams, titles, self.title_sizes,
+                             threshold))
+        author_scores = dict(_match(query_grams, authors, self.author_sizes,
+                                    threshold))
+
+        with self._lock:
+            author_books = {author_id: tuple(self.author_books.get(
+                author_id, ())) for author_id in author_scores}
+
+        for author_id, score in author_scores.items():
+            for book_id in author_books[author_id]:
+                if score > scores.get(book_id, (0, 0)):
+                    scores[book_id] = score
+
+        ranked = heapq.nsmallest(
+            limit, scores.items(),
+            key=lambda item: (-item[1][0], -item[1][1], item[0]))
+        return [(book_id, coverage) for book_id, (coverage, _) in ranked]
+
+    def _apply(self, change):
+        """
+        Applies a single change log entry to the index.
+
+        Parameter:
+            change (CatalogChange): The change log entry to be applied.
+
+        Returns:
+            None
+        """
+
+        payload = json.loads(change.payload)
+
+        if change.entity == ENTITY_BOOK:
+            if change.operation == OPERATION_INSERT:
+                self._add_book(*_book_key(payload))
+            elif change.operation == OPERATION_DELETE:
+                self._remove_book(*_book_key(payload))
+            elif change.operation == OPERATION_UPDATE:
+                self._remove_book(*_book_key(payload["before"]))
+                self._add_book(*_book_key(payload["after"]))
+
+        elif change.entity == ENTITY_AUTHOR:
+            if change.operation == OPERATION_INSERT:
+                self._add_author(int(payload["id"]), payload["name"])
+            elif change.operation == OPERATION_DELETE:
+                self._remove_author(int(payload["id"]), payload["name"])
+
+    def _add_book(self, book_id: int, author_id: int, title: str):
+        """
+        Adds a book's title trigrams to the index.
+        """
+        grams = trigrams(title)
+        for gram in grams:
+            self.title_postings.add(gram, book_id)
+        _set_size(self.title_sizes, book_id, len(grams))
+        self.author_books[author_id].add(book_id)
+
+    def _remove_book(self, book_id: int, author_id: int, title: str):
+        """
+        Removes a book's title trigrams from the index.
+        """
+        for gram in trigrams(title):
+            self.title_postings.discard(gram, book_id)
+        _set_size(self.title_sizes, book_id, 0)
+
+        books = self.author_books.get(author_id)
+        if books is not None:
+            books.discard(book_id)
+            if not books:
+                del self.author_books[author_id]
+
+    def _add_author(self, author_id: int, name: str):
+        """
+        Adds an author's name trigrams to the index.
+        """
+        grams = trigrams(name)
+        for gram in grams:
+            self.author_postings.add(gram, author_id)
+        _set_size(self.author_sizes, author_id, len(grams))
+
+    def _remove_author(self, author_id: int, name: str):
+        """
+        Removes an author and their book mapping from the index.
+        """
+        for gram in trigrams(name):
+            self.author_postings.discard(gram, author_id)
+        _set_size(self.author_sizes, author_id, 0)
+        self.author_books.pop(author_id, None)
+
+
+class Postings:
+    """
+    Trigram -> document ID postings kept as sorted arrays.
+
+    The sorted arrays in 'base' are never modified in place: writes go to
+    small per-trigram 'added' and 'removed' sets, and compact() merges them
+    into new arrays. A snapshot therefore only copies the pending changes
+    of the trigrams it needs and stays valid while writes continue.
+
+    Attributes:
+        base (dict): Trigram -> sorted array of document IDs.
+        added (dict): Trigram -> set of IDs not in the base array.
+        removed (dict): Trigram -> set of IDs of the base array that were
+                        removed.
+        pending (int): The number of writes since the last compaction.
+    """
+
+    def __init__(self, base=None):
+        self.base = base if base is not None else {}
+        self.added = defaultdict(set)
+        self.removed = defaultdict(set)
+        self.pending = 0
+
+    def add(self, gram: str, doc_id: int):
+        """
+        Adds a document to the postings of a trigram.
+        """
+        removed = self.removed.get(gram)
+        if removed and doc_id in removed:
+            removed.discard(doc_id)
+            if not removed:
+                del self.removed[gram]
+        elif not _contains(self.base.get(gram), doc_id):
+            self.added[gram].add(doc_id)
+        self.pending += 1
+
+    def discard(self, gram: str, doc_id: int):
+        """
+        Removes a document from the postings of a trigram, if present.
+        """
+        added = self.added.get(gram)
+        if added and doc_id in added:
+            added.discard(doc_id)
+            if not added:
+                del self.added[gram]
+        elif _contains(self.base.get(gram), doc_id):
+            self.removed[gram].add(doc_id)
+        self.pending += 1
+
+    def compact(self):
+        """
+        Merges the pending changes into new sorted base arrays.
+        """
+        if not self.added and not self.removed:
+            return
+
+        base = dict(self.base)
+        for gram in set(self.added) | set(self.removed):
+            ids = set(base.get(gram, ()))
+            ids -= self.removed.get(gram, set())
+            ids |= self.added.get(gram, set())
+            if ids:
+                base[gram] = array(ARRAY_TYPECODE, sorted(ids))
+            else:
+                base.pop(gram, None)
+
+        self.base = base
+        self.added = defaultdict(set)
+        self.removed = defaultdict(set)
+        self.pending = 0
+
+    def snapshot(self, grams) -> dict:
+        """
+        Takes a consistent view of the postings of the given trigrams.
+
+        Returns:
+            dict: Trigram -> (base array or None, added set, removed set).
+        """
+        empty = set()
+        return {gram: (self.base.get(gram),
+                       set(self.added.get(gram, empty)),
+                       set(self.removed.get(gram, empty)))
+                for gram in grams}
+
+
+def _match(query_grams: set, postings: dict, sizes: array,
+           threshold: float):
+    """
+    Yields the documents whose trigram similarity to the query reaches the
+    threshold.
+
+    Parameters:
+        query_grams (set): The trigrams of the query.
+        postings (dict): A Postings.snapshot() of the query's trigrams.
+        sizes (array): Number of trigrams of each document, by ID.
+        threshold (float): The minimum similarity.
+
+    Returns:
+        generator: (document ID, (similarity, Jaccard index)) tuples.
+    """
+
+    query_size = len(query_grams)
+
+    def frequency(gram):
+        base, added, removed = postings[gram]
+        return (len(base) if base else 0) + len(added) - len(removed)
+
+    # A document with similarity >= threshold shares at least min_shared
+    # trigrams with the query, so it must appear in one of the
+    # (query_size - min_shared + 1) smallest postings.
+    min_shared = max(1, math.ceil(threshold * query_size - 1e-9))
+    by_frequency = sorted(query_grams, key=frequency)
+    prefix = by_frequency[:query_size - min_shared + 1]
+
+    candidates = set()
+    for gram in prefix:
+        base, added, removed = postings[gram]
+        room = MAX_CANDIDATES - len(candidates)
+        if base:
+            candidates.update(set(base[:room + len(removed)]) - removed)
+        candidates.update(added)
+        if len(candidates) >= MAX_CANDIDATES:
+            break
+
+    shared = Counter()
+    for gram in by_frequency:
+        base, added, removed = postings[gram]
+        shared.update(_hits(base, candidates) - removed)
+        shared.update(candidates & added)
+
+    for doc_id, count in shared.items():
+        coverage = count / query_size
+        if coverage >= threshold:
+            size = sizes[doc_id] if doc_id < len(sizes) else 0
+            jaccard = count / max(query_size + size - count, 1)
+            yield doc_id, (coverage, jaccard)
+
+
+def _hits(base, candidates: set) -> set:
+    """
+    Returns the candidates contained in a sorted base array, scanning the
+    array when it is short and binary-searching it otherwise.
+    """
+    if not base:
+        return set()
+
+    if len(base) <= SCAN_FACTOR * len(candidates):
+        return candidates.intersection(base)
+
+    return {doc_id for doc_id in candidates if _contains(base, doc_id)}
+
+
+def _contains(base, doc_id: int) -> bool:
+    """
+    Checks whether a sorted array (or None) contains a document ID.
+    """
+    if not base:
+        return False
+    position = bisect_left(base, doc_id)
+    return position < len(base) and base[position] == doc_id
+
+
+def _set_size(sizes: array, doc_id: int, size: int):
+    """
+    Stores the trigram count of a document in a size array, growing it
+    as needed.
+    """
+    if doc_id >= len(sizes):
+        if not size:
+            return
+        grow = doc_id + 1 - len(sizes) + len(sizes) // 8
+        sizes.extend(array(SIZE_TYPECODE, bytes(grow * sizes.itemsize)))
+    sizes[doc_id] = min(size, MAX_SIZE)
+
+
+def _book_key(payload: dict) -> tuple:
+    """
+    Extracts the (book ID, author ID, title) of a book snapshot, with the
+    IDs coerced to int.
+    """
+
+    return int(payload["id"]), int(payload["author_id"]), payload["title"]
+
+
+def _flatten(postings: dict, keys: list) -> tuple:
+    """
+    Converts a mapping of ID collections into an array of their lengths
+    (in the order of keys) and one array of all their sorted IDs.
+    """
+    lengths = array(ARRAY_TYPECODE)
+    ids = array(ARRAY_TYPECODE)
+    for key in keys:
+        values = sorted(postings[key])
+        lengths.append(len(values))
+        ids.extend(values)
+    return lengths, ids
+
+
+def _unflatten(keys, lengths: array, ids: array):
+    """
+    Rebuilds the (key, ID array) pairs of a mapping flattened by _flatten().
+    """
+    if len(keys) != len(lengths) or sum(lengths) != len(ids):
+        raise ValueError("inconsistent array lengths")
+
+    start = 0
+    for key, length in zip(keys, lengths):
+        yield key, ids[start:start + length]
+        start += length